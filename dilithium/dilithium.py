@@ -1,10 +1,12 @@
+import logging
 import numpy as np
 import secrets
 from functools import lru_cache
 
-from dilithium.rings import Polynomial
-from dilithium.hash import expand_seed, generate_matrix_from_seed, generate_challenge
+from dilithium.rings import Polynomial, _ntt, _intt, ntt_batch
+from dilithium.hash import TAU, expand_seed, generate_matrix_from_seed, generate_challenge
 
+log = logging.getLogger(__name__)
 
 # System constants from Dilithium paper
 Q = Polynomial.Q  # q = 2^23 - 2^13 + 1 = 8380417
@@ -15,6 +17,9 @@ GAMMA1 = Q
 GAMMA2 = Q
 BETA = 1
 
+# Number of sign attempts sampled and checked together
+SIGN_BATCH = 4
+
 # Domain separators
 DOMAIN_SMALL_POLY = 0x03
 DOMAIN_Y_POLY = 0x05
@@ -27,6 +32,19 @@ PARAMS = {
 }
 
 
+@lru_cache(maxsize=64)
+def _compute_A_ntt(rho: bytes, k: int, l: int) -> np.ndarray:  # noqa: E741
+    """
+    Expand rho into matrix A in NTT form, cached on (rho, k, l).
+
+    Shared by keygen, sign and verify, so every verifier of signatures
+    under the same public key expands A only once.
+    """
+    A_ntt = _ntt(generate_matrix_from_seed(rho, k, l))
+    A_ntt.setflags(write=False)  # shared between callers through the cache
+    return A_ntt
+
+
 class OptimizedDilithium:
     def __init__(self, security_level=2):
         if security_level not in PARAMS:
@@ -37,102 +55,136 @@ class OptimizedDilithium:
         self.l = params["l"]
         self.eta = params["eta"]
 
+        # Compile (or load cached) NTT kernels before the first keygen
+        self._matmul_ntt = None
+        if ntt_batch is not None:
+            from dilithium.ntt_numba import make_matmul_ntt, warmup
+            warmup()
+            self._matmul_ntt = make_matmul_ntt(self.k, self.l)
+
         self.rho = None
         self.t = None
         self.s1 = None
         self.s2 = None
 
-    def _generate_vector(self, size: int, bound: int, domain: int) -> list:
+    def _generate_vector(self, size: int, bound: int, domain: int) -> np.ndarray:
+        """Sample a (size, N) array with coefficients in [-bound, bound] mod Q"""
         seed = secrets.token_bytes(32)
         total_coeffs = size * Polynomial.N
         randomness = expand_seed(seed, domain, total_coeffs * 4)
-        coeffs = np.frombuffer(randomness, dtype=np.uint32)
-        coeffs = coeffs % (2 * bound + 1)
-        coeffs = coeffs.astype(np.int32) - bound
-        coeffs = coeffs.reshape(size, Polynomial.N)
-        return [Polynomial(row.tolist()) for row in coeffs]
-
-    def generate_y_vector(self) -> list:
+        # One int64 copy of the SHAKE output, then reduce it in place
+        coeffs = np.frombuffer(randomness, dtype="<u4").astype(np.int64)
+        coeffs %= 2 * bound + 1
+        coeffs -= bound
+        coeffs %= Q
+        return coeffs.reshape(size, Polynomial.N)
+
+    def generate_y_vector(self) -> np.ndarray:
         return self._generate_vector(self.l, GAMMA1, DOMAIN_Y_POLY)
 
+    def generate_y_vector_batch(self, batch: int) -> np.ndarray:
+        """Sample `batch` independent y vectors as a (batch, l, N) array"""
+        Y = self._generate_vector(batch * self.l, GAMMA1, DOMAIN_Y_POLY)
+        return Y.reshape(batch, self.l, Polynomial.N)
+
     def generate_small_vector(self, size: int) -> list:
-        return self._generate_vector(size, self.eta, DOMAIN_SMALL_POLY)
+        coeffs = self._generate_vector(size, self.eta, DOMAIN_SMALL_POLY)
+        return [Polynomial(row) for row in coeffs]
+
+    @staticmethod
+    def _to_ntt(vector: list) -> np.ndarray:
+        """Stack a vector of polynomials into an (len, N) NTT-domain array"""
+        return _ntt(np.stack([p.coefficients for p in vector]))
+
+    @staticmethod
+    def _stack_vector(vector, rows: int):
+        """Stack polynomials into a (rows, N) array, or None on a shape mismatch"""
+        arrays = [np.asarray(p.coefficients) for p in vector]
+        if len(arrays) != rows or any(a.shape != (Polynomial.N,) for a in arrays):
+            return None
+        return np.stack(arrays)
 
-    @lru_cache(maxsize=None)  # Changed to support multiple cache entries
     def get_matrix_A(self):
-        """Get cached matrix A using rho as part of cache key"""
+        """Get cached matrix A in NTT form as a (k, l, N) array"""
         if self.rho is None:
             raise ValueError("Keys not generated")
 
-        # Include rho in computation to make it part of cache key
-        matrix = generate_matrix_from_seed(self.rho, self.k, self.l)
-        return matrix
-
-    def _matrix_multiply(self, matrix: list, vector: list) -> list:
-        result = []
-        for row in matrix:
-            sum_poly = Polynomial()
-            for a, v in zip(row, vector):
-                sum_poly = sum_poly + (a * v)
-            result.append(sum_poly)
-        return result
+        return _compute_A_ntt(self.rho, self.k, self.l)
+
+    def _matrix_multiply(self, A_ntt: np.ndarray, v_ntt: np.ndarray) -> np.ndarray:
+        """
+        Compute A·v from NTT-domain A (k, l, N) and v (l, N) or a batch of
+        vectors (B, l, N); returns (k, N) or (B, k, N) respectively.
+        """
+        batch = v_ntt.reshape(-1, self.l, Polynomial.N)
+        if self._matmul_ntt is not None:
+            # Kernel output is already in [0, Q)
+            result = _intt(self._matmul_ntt(A_ntt, batch), reduce=False)
+        else:
+            result = _intt(np.einsum("kln,bln->bkn", A_ntt, batch))
+        return result.reshape(v_ntt.shape[:-2] + (self.k, Polynomial.N))
 
     def keygen(self):
         """Generate a new keypair"""
         self.rho = secrets.token_bytes(32)
 
-        A = self.get_matrix_A()
         self.s1 = self.generate_small_vector(self.l)
         self.s2 = self.generate_small_vector(self.k)
 
-        self.t = self._matrix_multiply(A, self.s1)
-        for i in range(self.k):
-            self.t[i] = self.t[i] + self.s2[i]
+        t = self._matrix_multiply(self.get_matrix_A(), self._to_ntt(self.s1))
+        self.t = [Polynomial(row) + s for row, s in zip(t, self.s2)]
 
         return (self.rho, self.t), (self.s1, self.s2)
 
-    def sign(self, message: bytes, max_attempts=100):
+    def sign(self, message: bytes, max_attempts=100, batch_size=SIGN_BATCH):
         if not all([self.rho, self.t, self.s1, self.s2]):
             raise ValueError("Keys not generated")
+        if batch_size < 1:
+            raise ValueError("batch_size must be >= 1")
 
-        A = self.get_matrix_A()
         public_key = (self.rho, self.t)
 
+        # Derived from the current keys on every call, so keys assigned
+        # directly (or replaced after keygen) are never signed with stale
+        # values; both are then reused across all attempts
+        A_ntt = self.get_matrix_A()
+        s1_ntt = self._to_ntt(self.s1)
+
         attempts = 0
         while attempts < max_attempts:
-            attempts += 1
-            if attempts % 10 == 0:
-                print(f"Attempt {attempts}/{max_attempts}")
+            # First attempt alone (often accepted), then full batches
+            batch = min(batch_size if attempts else 1, max_attempts - attempts)
+            log.debug("Attempts %d-%d/%d", attempts + 1, attempts + batch, max_attempts)
 
-            # Sample y with coefficients in [-γ₁, γ₁]
-            y = self.generate_y_vector()
+            # Sample a batch of y with coefficients in [-γ₁, γ₁]
+            Y = self.generate_y_vector_batch(batch)
 
-            # Compute w = Ay
-            w = self._matrix_multiply(A, y)
+            # Compute w = Ay for the whole batch
+            W = self._matrix_multiply(A_ntt, _ntt(Y, reduce=False))
 
-            # Check if w is small enough (||w||∞ < γ₂)
-            w_coeffs = np.concatenate([np.array(p.coefficients) for p in w])
-            if np.any(np.abs(w_coeffs) > GAMMA2):
-                continue
+            # Keep the attempts whose w is small enough (||w||∞ < γ₂)
+            w_ok = np.abs(W).reshape(batch, -1).max(axis=1) <= GAMMA2
 
-            print("w processed")
+            for b in np.flatnonzero(w_ok):
+                log.debug("w processed")
 
-            # Generate challenge using raw w
-            c = generate_challenge(message, public_key, w)
+                # Generate challenge using raw w
+                c = generate_challenge(message, public_key, W[b])
 
-            # Compute z = y + cs₁
-            z = []
-            for i in range(self.l):
-                z_poly = y[i] + (c * self.s1[i])
-                z.append(z_poly)
+                # Compute z = y + cs₁ with one NTT of c against the precomputed NTT(s₁)
+                c_ntt = _ntt(c.coefficients)
+                Z = (Y[b] + _intt(c_ntt * s1_ntt)) % Q
 
-            # Check z bounds
-            z_coeffs = np.concatenate([np.array(p.coefficients) for p in z])
-            if np.any(np.abs(z_coeffs) >= GAMMA1 - BETA):
-                continue
+                # Check z bounds
+                if np.abs(Z).max() >= GAMMA1 - BETA:
+                    continue
 
-            print(f"Succeeded after {attempts} attempts")
-            return z, c, w  # NOTE: return raw w
+                log.debug("Succeeded after %d attempts", attempts + b + 1)
+                z = [Polynomial(row) for row in Z]
+                w = [Polynomial(row) for row in W[b]]
+                return z, c, w  # NOTE: return raw w
+
+            attempts += batch
 
         raise RuntimeError("Failed to generate signature after max attempts")
 
@@ -140,30 +192,43 @@ class OptimizedDilithium:
         z, c, w_raw = signature
         rho, t = public_key
 
+        # Reject vectors sized for another parameter set before any arithmetic
+        Z = self._stack_vector(z, self.l)
+        W = self._stack_vector(w_raw, self.k)
+        T = self._stack_vector(t, self.k)
+        if Z is None or W is None or T is None or c.coefficients.shape != (Polynomial.N,):
+            log.debug("Signature or public key has the wrong shape")
+            return False
+
         # Verify z bounds
-        z_coeffs = np.concatenate([np.array(p.coefficients) for p in z])
-        if np.any(np.abs(z_coeffs) >= GAMMA1 - BETA):
-            print("z bounds check failed")
+        if np.abs(Z).max() >= GAMMA1 - BETA:
+            log.debug("z bounds check failed")
             return False
 
         # Process w like in sign()
-        w_processed = []
-        for poly in w_raw:
-            coeffs = np.array(poly.coefficients)
-            coeffs = np.abs(coeffs) % Q
-            w_processed.append(Polynomial(coeffs.tolist()))
+        W = np.abs(W) % Q
 
         # Verify w bounds
-        w_coeffs = np.concatenate([np.array(p.coefficients) for p in w_processed])
-        if np.any(np.abs(w_coeffs) >= GAMMA2):
-            print("w bounds check failed")
+        if W.max() >= GAMMA2:
+            log.debug("w bounds check failed")
+            return False
+
+        # Verify w against the public key: w - (Az - ct) = cs₂, and every
+        # coefficient of cs₂ is at most τ·η in absolute value
+        A_ntt = _compute_A_ntt(bytes(rho), self.k, self.l)
+        c_ntt = _ntt(c.coefficients)
+        t_ntt = _ntt(T)
+        Az = self._matrix_multiply(A_ntt, _ntt(Z))
+        diff = (W - Az + _intt(c_ntt * t_ntt)) % Q
+        if np.minimum(diff, Q - diff).max() > TAU * self.eta:
+            log.debug("w does not match Az - ct")
             return False
 
         # Recompute challenge
-        c_prime = generate_challenge(message, public_key, w_processed)
+        c_prime = generate_challenge(message, public_key, W)
 
         if not np.array_equal(c.coefficients, c_prime.coefficients):
-            print("Challenge mismatch (final c ≠ original c)")
+            log.debug("Challenge mismatch (final c ≠ original c)")
             return False
 
         return True
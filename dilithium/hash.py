@@ -3,14 +3,13 @@ Optimized SHAKE128 Implementation for Dilithium
 
 Key optimizations:
 1. Batch operations with numpy
-2. Cached matrix generation
-3. Vectorized coefficient generation
-4. Pre-allocated buffers
+2. Vectorized coefficient generation
+3. Pre-allocated buffers
+4. OpenSSL-backed SHAKE128 from hashlib
 """
 
 import numpy as np
-from Crypto.Hash import SHAKE128
-from functools import lru_cache
+from hashlib import shake_128
 
 from dilithium.rings import Polynomial
 
@@ -22,74 +21,65 @@ DOMAIN_MESSAGE = 0x04
 # Constants
 TAU = 60  # Number of ±1's in challenge polynomial
 CHUNK_SIZE = 4  # Bytes per coefficient
+COEFF_MASK = 0x7FFFFF  # Low 23 bits, the bit length of Q
 
 
 class OptimizedHasher:
     def __init__(self):
         """Initialize with reusable SHAKE128 instances"""
-        self._shake = SHAKE128.new()
-        self._matrix_cache = {}
+        self._shake = shake_128()
 
     def reset(self):
         """Reset SHAKE instance"""
-        self._shake = SHAKE128.new()
+        self._shake = shake_128()
         return self
 
     @staticmethod
-    @lru_cache(maxsize=32)
     def expand_seed(seed: bytes, domain: int, length: int) -> bytes:
-        """Cached seed expansion"""
-        shake = SHAKE128.new()
-        shake.update(seed + bytes([domain]))
-        return shake.read(length)
+        """Seed expansion (seeds are fresh per call, so nothing to cache)"""
+        return shake_128(seed + bytes([domain])).digest(length)
 
-    def generate_matrix(self, seed: bytes, k: int, l: int) -> list:
+    def generate_matrix(self, seed: bytes, k: int, l: int) -> np.ndarray:
         """
-        Optimized matrix generation with caching and vectorized operations.
-        """
-        cache_key = (seed, k, l)
-        if cache_key in self._matrix_cache:
-            print("DEBUG: Matrix fetched from cache.")
-            return self._matrix_cache[cache_key]
-
-
-        matrix = [[None for _ in range(l)] for _ in range(k)]
+        Optimized matrix generation with vectorized operations.
 
+        Returns the coefficients of A as a (k, l, N) int64 array. Callers
+        cache the result (see _compute_A_ntt in dilithium.dilithium).
+        """
         total_coeffs = k * l * Polynomial.N
-        total_bytes = total_coeffs * CHUNK_SIZE
-
-
-        shake = SHAKE128.new()
-        shake.update(seed + bytes([DOMAIN_MATRIX]))
-
-        all_data = np.frombuffer(shake.read(total_bytes), dtype=np.uint8)
-
-        coeffs_array = all_data.reshape(-1, CHUNK_SIZE)
 
-        coeffs = (
-                coeffs_array[:, 0].astype(np.int32)
-                | (coeffs_array[:, 1].astype(np.int32) << 8)
-                | (coeffs_array[:, 2].astype(np.int32) << 16)
-                | (coeffs_array[:, 3].astype(np.int32) << 24)
-        )
+        shake = shake_128(seed + bytes([DOMAIN_MATRIX]))
+
+        # Rejection sampling: keep 23-bit words below Q (acceptance ~99.9%),
+        # reading a little extra up front so a refill is rarely needed.
+        # Accepted words are written straight into the preallocated output.
+        # digest() always restarts the XOF, so a refill takes a longer
+        # digest and skips the bytes already consumed.
+        matrix = np.empty(total_coeffs, dtype=np.int64)
+        filled = 0
+        offset = 0
+        request = total_coeffs + total_coeffs // 64
+        while filled < total_coeffs:
+            end = offset + request * CHUNK_SIZE
+            stream = np.frombuffer(shake.digest(end), dtype="<u4", offset=offset)
+            offset = end
+            stream = stream & COEFF_MASK
+            accepted = stream[stream < Polynomial.Q][: total_coeffs - filled]
+            matrix[filled:filled + len(accepted)] = accepted
+            filled += len(accepted)
+            request = total_coeffs - filled + 8
+
+        matrix = matrix.reshape(k, l, Polynomial.N)
 
-        coeffs = coeffs % Polynomial.Q
-        coeffs = coeffs.reshape(k, l, Polynomial.N)
-
-        for i in range(k):
-            for j in range(l):
-                matrix[i][j] = Polynomial(coeffs[i, j])
-
-        self._matrix_cache[cache_key] = matrix
         return matrix
 
     def hash_message(self, message: bytes) -> bytes:
         """Optimized message hashing"""
         self.reset()
         self._shake.update(bytes([DOMAIN_MESSAGE]) + message)
-        return self._shake.read(32)
+        return self._shake.digest(32)
 
-    def generate_challenge(self, message: bytes, public_key: tuple, w1: list) -> Polynomial:
+    def generate_challenge(self, message: bytes, public_key: tuple, W: np.ndarray) -> Polynomial:
         """Optimized challenge generation with debug output"""
         rho, _ = public_key
 
@@ -102,38 +92,34 @@ class OptimizedHasher:
         self._shake.update(mu)
         self._shake.update(rho)
 
-        # Process w coefficients
-        for poly in w1:
-            coeffs = np.array(poly.coefficients, dtype=np.int32)
-            self._shake.update(coeffs.tobytes())
+        # Process w coefficients as one contiguous (k, N) int32 buffer
+        self._shake.update(np.ascontiguousarray(W, dtype=np.int32).tobytes())
 
         self._shake.update(bytes([DOMAIN_CHALLENGE]))
 
-        # Generate challenge bytes
-        challenge_bytes = np.frombuffer(self._shake.read(TAU * 2), dtype=np.uint8)
+        # SampleInBall: 64 sign bits, then a partial Fisher-Yates shuffle
+        # with position bytes rejection-sampled so they stay unbiased
+        stream = self._shake.digest(8 + TAU * 2)
+        signs = int.from_bytes(stream[:8], "little")
+        pos_idx = 8
 
         # Pre-allocate coefficient array
-        coeffs = np.zeros(Polynomial.N, dtype=np.int32)
-
-        # Process positions and signs
-        positions = (
-                            challenge_bytes[::2].astype(np.uint16)
-                            | (challenge_bytes[1::2].astype(np.uint16) << 8)
-                    ) % Polynomial.N
-
-        signs = np.where(challenge_bytes[::2] & 0x80, 1, -1)
+        coeffs = np.zeros(Polynomial.N, dtype=np.int64)
 
-        used_positions = set()
-        pos_idx = 0
+        for i in range(Polynomial.N - TAU, Polynomial.N):
+            while True:
+                if pos_idx == len(stream):
+                    # Longer digest of the same state; earlier bytes repeat
+                    stream = self._shake.digest(len(stream) + TAU)
+                j = stream[pos_idx]
+                pos_idx += 1
+                if j <= i:
+                    break
+            coeffs[i] = coeffs[j]
+            coeffs[j] = 1 - 2 * (signs & 1)
+            signs >>= 1
 
-        while len(used_positions) < TAU and pos_idx < len(positions):
-            pos = positions[pos_idx]
-            if pos not in used_positions:
-                coeffs[pos] = signs[pos_idx]
-                used_positions.add(pos)
-            pos_idx += 1
-
-        return Polynomial(coeffs)
+        return Polynomial(coeffs % Polynomial.Q)
 
 
 # Global instance for reuse
@@ -145,7 +131,7 @@ def expand_seed(seed: bytes, domain: int, length: int) -> bytes:
     return OptimizedHasher.expand_seed(seed, domain, length)
 
 
-def generate_matrix_from_seed(seed: bytes, k: int, l: int) -> list:  # noqa: E741
+def generate_matrix_from_seed(seed: bytes, k: int, l: int) -> np.ndarray:  # noqa: E741
     return HASHER.generate_matrix(seed, k, l)
 
 
@@ -153,8 +139,8 @@ def hash_message(message: bytes) -> bytes:
     return HASHER.hash_message(message)
 
 
-def generate_challenge(message: bytes, public_key: tuple, w1: list) -> Polynomial:
-    return HASHER.generate_challenge(message, public_key, w1)
+def generate_challenge(message: bytes, public_key: tuple, W: np.ndarray) -> Polynomial:
+    return HASHER.generate_challenge(message, public_key, W)
 
 
 def test_performance():
@@ -175,16 +161,11 @@ def test_performance():
     _ = generate_matrix_from_seed(seed, 4, 4)
     print(f"4x4 matrix generation: {time.time() - start:.3f} seconds")
 
-    # Test cached matrix generation
-    start = time.time()
-    _ = generate_matrix_from_seed(seed, 4, 4)
-    print(f"Cached matrix generation: {time.time() - start:.3f} seconds")
-
     # Test challenge generation
-    dummy_w1 = [Polynomial([1, 2, 3]) for _ in range(4)]
+    dummy_w = np.tile(np.arange(Polynomial.N, dtype=np.int64), (4, 1))
     start = time.time()
     for _ in range(100):
-        _ = generate_challenge(b"test message", (seed, dummy_w1), dummy_w1)
+        _ = generate_challenge(b"test message", (seed, None), dummy_w)
     print(f"100 challenge generations: {time.time() - start:.3f} seconds")
 
 
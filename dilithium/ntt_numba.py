@@ -0,0 +1,145 @@
+"""
+Numba-compiled NTT kernels for Dilithium
+
+Key optimizations:
+1. Whole 8-stage butterfly network in one compiled loop
+2. Rows of a batch transformed in parallel with prange
+3. Compiled code cached on disk between runs
+4. Division-free double-precision modular multiplication
+5. Matrix-vector kernels specialized per (k, l) parameter set
+"""
+
+import math
+from functools import lru_cache
+
+import numpy as np
+from numba import njit, prange, types
+
+# Ring constants (same values as Polynomial.Q / Polynomial.N)
+Q = 8380417
+N = 256
+
+# Reciprocal of Q for double-precision modular multiplication. With kernel
+# inputs in [0, Q), operands stay below 2^27 in magnitude, so every product
+# is exact in a float64.
+QF = float(Q)
+U = 1.0 / QF
+
+
+@njit(inline="always")
+def mulmod_fma(x, y):
+    """
+    Return x·y mod Q in [0, Q) using float64 arithmetic only.
+
+    Follows the FMA-based modular multiplication: h = x·y, c = floor(h/Q),
+    d = h - c·Q, then one conditional correction each way for the rounding
+    of h·U. The low part fma(x, y, -h) is always zero here because h is
+    exact, so no fused multiply-add is actually required.
+    """
+    h = x * y
+    c = math.floor(h * U)
+    d = h - c * QF
+    if d >= QF:
+        d -= QF
+    if d < 0.0:
+        d += QF
+    return d
+
+
+@njit(cache=True, parallel=True, fastmath=False, boundscheck=False)
+def ntt_batch(a, zetas):
+    """
+    In-place forward negacyclic NTT of every row of an (rows, N) int64 array.
+
+    Input coefficients must be in [0, Q); larger values make the float64
+    products inexact and give wrong results without an error. zetas is a
+    float64 table; output is normalized to [0, Q).
+    """
+    for r in prange(a.shape[0]):
+        row = np.empty(N, dtype=np.float64)
+        for j in range(N):
+            row[j] = a[r, j]
+        length = N // 2
+        blocks = 1
+        while length >= 1:
+            for b in range(blocks):
+                zeta = zetas[blocks + b]
+                start = 2 * length * b
+                for j in range(start, start + length):
+                    t = mulmod_fma(zeta, row[j + length])
+                    row[j + length] = row[j] - t
+                    row[j] = row[j] + t
+            length //= 2
+            blocks *= 2
+        for j in range(N):
+            a[r, j] = np.int64(mulmod_fma(row[j], 1.0))
+
+
+@njit(cache=True, parallel=True, fastmath=False, boundscheck=False)
+def intt_batch(a, zetas_inv, n_inv):
+    """
+    In-place inverse of ntt_batch, including the final N^-1 scaling.
+
+    Input coefficients must be in [0, Q), which the butterflies rely on to
+    keep every intermediate sum reduced. zetas_inv is a float64 table;
+    output is in [0, Q).
+    """
+    for r in prange(a.shape[0]):
+        row = np.empty(N, dtype=np.float64)
+        for j in range(N):
+            row[j] = a[r, j]
+        length = 1
+        blocks = N // 2
+        while blocks >= 1:
+            for b in range(blocks):
+                zeta = zetas_inv[blocks + b]
+                start = 2 * length * b
+                for j in range(start, start + length):
+                    lo = row[j]
+                    hi = row[j + length]
+                    s = lo + hi
+                    if s >= QF:
+                        s -= QF
+                    row[j] = s
+                    row[j + length] = mulmod_fma(zeta, lo - hi)
+            length *= 2
+            blocks //= 2
+        for j in range(N):
+            a[r, j] = np.int64(mulmod_fma(row[j], n_inv))
+
+
+@lru_cache(maxsize=None)
+def make_matmul_ntt(k, l):  # noqa: E741
+    """
+    Build an NTT-domain matrix-vector product for fixed k and l.
+
+    k and l are closure constants, so numba sees fixed trip counts and
+    unrolls the accumulation. The returned kernel maps A (k, l, N) and a
+    batch of vectors v (B, l, N) to A·v (B, k, N) in [0, Q).
+    """
+    signature = types.int64[:, :, ::1](
+        types.Array(types.int64, 3, "C", readonly=True), types.int64[:, :, ::1]
+    )
+
+    @njit(signature, cache=True, boundscheck=False, error_model="numpy")
+    def matmul_ntt(A_ntt, v_ntt):
+        out = np.empty((v_ntt.shape[0], k, N), dtype=np.int64)
+        for b in range(v_ntt.shape[0]):
+            for i in range(k):
+                for n in range(N):
+                    # At most l products below Q^2: exact in a float64
+                    acc = 0.0
+                    for j in range(l):
+                        acc += float(A_ntt[i, j, n]) * float(v_ntt[b, j, n])
+                    out[b, i, n] = np.int64(mulmod_fma(acc, 1.0))
+        return out
+
+    return matmul_ntt
+
+
+def warmup():
+    """Compile (or load from cache) both kernels with a dummy 1 x N batch"""
+    dummy = np.zeros((1, N), dtype=np.int64)
+    zetas = np.ones(N, dtype=np.float64)
+    ntt_batch(dummy, zetas)
+    intt_batch(dummy, zetas, 1.0)
@@ -9,7 +9,6 @@ Key optimizations:
 """
 
 import numpy as np
-from functools import lru_cache
 
 
 class Polynomial:
@@ -19,66 +18,65 @@ class Polynomial:
     Q = 8380417  # modulus q = 2^23 - 2^13 + 1
 
     def __init__(self, coefficients=None):
-        """Initialize polynomial with numpy array coefficients"""
+        """
+        Initialize polynomial with numpy array coefficients.
+
+        Coefficients are expected to be reduced modulo Q already. A length-N
+        int64 array is used as-is; shorter input is zero-padded.
+        """
         if coefficients is None:
-            self.coefficients = np.zeros(self.N, dtype=np.int32)
+            self.coefficients = np.zeros(self.N, dtype=np.int64)
+            return
+
+        coeffs = np.asarray(coefficients, dtype=np.int64)
+        if coeffs.shape[0] == self.N:
+            self.coefficients = coeffs
         else:
-            coeffs = np.array(coefficients[: self.N], dtype=np.int32)
-            # Add check for large coefficients
-            max_coeff = np.max(np.abs(coeffs))
-            if max_coeff > self.Q:
-                print(f"Warning: Large coefficients detected: {max_coeff} > {self.Q}")
-                print("Coefficients will be reduced modulo Q")
+            coeffs = coeffs[: self.N]
+            self.coefficients = np.zeros(self.N, dtype=np.int64)
+            self.coefficients[: coeffs.shape[0]] = coeffs
 
-            self.coefficients = np.pad(
-                coeffs % self.Q, (0, self.N - len(coeffs)), "constant"
-            )
+    @classmethod
+    def from_raw(cls, coefficients):
+        """Wrap a length-N array reduced modulo Q without any checks or copies"""
+        poly = cls.__new__(cls)
+        poly.coefficients = coefficients
+        return poly
 
     def __add__(self, other):
         """Vectorized addition modulo Q"""
-        return Polynomial((self.coefficients + other.coefficients) % self.Q)
+        return Polynomial.from_raw((self.coefficients + other.coefficients) % self.Q)
 
     def __sub__(self, other):
         """Vectorized subtraction modulo Q"""
-        return Polynomial((self.coefficients - other.coefficients) % self.Q)
-
-    @staticmethod
-    @lru_cache(maxsize=1)
-    def _get_multiplication_helper():
-        """Cache helper arrays for multiplication"""
-        # Pre-compute arrays for faster multiplication
-        indices = np.arange(Polynomial.N)
-        neg_ones = np.where(indices >= Polynomial.N // 2, -1, 1)
-        return indices, neg_ones
+        return Polynomial.from_raw((self.coefficients - other.coefficients) % self.Q)
 
     def __mul__(self, other):
-        """Optimized polynomial multiplication using numpy"""
+        """Polynomial multiplication via the negacyclic NTT"""
         if isinstance(other, (int, np.integer)):
             # Fast scalar multiplication
-            return Polynomial((self.coefficients * other) % self.Q)
-
-        # Get cached helper arrays
-        indices, neg_ones = self._get_multiplication_helper()
+            return Polynomial(((self.coefficients % self.Q) * (other % self.Q)) % self.Q)
 
-        # Convert to numpy arrays for faster operations
-        a = self.coefficients
-        b = other.coefficients
+        if ntt_batch is None:
+            return Polynomial(self._mul_convolve(other))
 
-        # Initialize result array
-        result = np.zeros(self.N, dtype=np.int32)
+        # Pointwise product in the NTT domain is multiplication mod X^N + 1
+        a_hat = _ntt(self.coefficients)
+        b_hat = _ntt(other.coefficients)
+        return Polynomial(_intt(a_hat * b_hat))
 
-        # Vectorized multiplication
-        for i in range(self.N):
-            # Compute all products for this coefficient at once
-            prods = a[i] * b
+    def _mul_convolve(self, other):
+        """
+        Schoolbook product via a single np.convolve.
 
-            # Apply signs based on reduction by X^N + 1
-            signs = np.where(i + indices >= self.N, -1, 1)
-
-            # Add to result with proper signs
-            result = (result + signs * np.roll(prods, -i)) % self.Q
-
-        return Polynomial(result)
+        Faster than the NumPy NTT for one product, so it is used when the
+        compiled kernels are unavailable. X^N = -1 folds the upper half of
+        the full product back onto the lower half with a negative sign.
+        """
+        conv = np.convolve(self.coefficients % self.Q, other.coefficients % self.Q)
+        result = conv[: self.N].copy()
+        result[: self.N - 1] -= conv[self.N:]
+        return result % self.Q
 
     def __str__(self):
         """Efficient string representation"""
@@ -99,6 +97,85 @@ class Polynomial:
         return " + ".join(terms)
 
 
+# NTT tables: ZETA is a primitive 512th root of unity mod Q, so X^N + 1 splits
+# completely and the transform needs no separate X^N + 1 reduction step.
+ZETA = 1753
+
+
+def _bit_reverse(i: int, bits: int = 8) -> int:
+    return int(format(i, f"0{bits}b")[::-1], 2)
+
+
+ZETAS = np.array(
+    [pow(ZETA, _bit_reverse(i), Polynomial.Q) for i in range(Polynomial.N)],
+    dtype=np.int64,
+)
+ZETAS_INV = np.array(
+    [pow(ZETA, -_bit_reverse(i), Polynomial.Q) for i in range(Polynomial.N)],
+    dtype=np.int64,
+)
+N_INV = pow(Polynomial.N, -1, Polynomial.Q)
+
+try:
+    from dilithium.ntt_numba import ntt_batch, intt_batch
+
+    # The compiled kernels do their modular arithmetic in float64
+    ZETAS_F64 = ZETAS.astype(np.float64)
+    ZETAS_INV_F64 = ZETAS_INV.astype(np.float64)
+except ImportError:  # numba not installed: fall back to the NumPy stages below
+    ntt_batch = intt_batch = None
+
+
+def _ntt(a: np.ndarray, reduce: bool = True) -> np.ndarray:
+    """
+    Forward negacyclic NTT over the last axis (bit-reversed output order).
+
+    Each Cooley-Tukey stage is done for all of its butterflies at once by
+    viewing the array as (..., blocks, 2, length). Pass reduce=False only
+    for input already in [0, Q) to skip the initial reduction.
+    """
+    Q, N = Polynomial.Q, Polynomial.N
+    # Working copy, reduced unless the caller vouches for it: the compiled
+    # kernels are only exact for inputs in [0, Q)
+    a = np.asarray(a, dtype=np.int64) % Q if reduce else np.array(a, dtype=np.int64)
+    if ntt_batch is not None:
+        ntt_batch(a.reshape(-1, N), ZETAS_F64)
+        return a
+
+    lead = a.shape[:-1]
+    length, blocks = N // 2, 1
+    while length >= 1:
+        v = a.reshape(*lead, blocks, 2, length)
+        zetas = ZETAS[blocks:2 * blocks, None]
+        t = (zetas * v[..., 1, :]) % Q
+        v[..., 1, :] = (v[..., 0, :] - t) % Q
+        v[..., 0, :] = (v[..., 0, :] + t) % Q
+        length //= 2
+        blocks *= 2
+    return a
+
+
+def _intt(a: np.ndarray, reduce: bool = True) -> np.ndarray:
+    """Inverse of _ntt (Gentleman-Sande butterflies, scaled by N^-1)"""
+    Q, N = Polynomial.Q, Polynomial.N
+    a = np.asarray(a, dtype=np.int64) % Q if reduce else np.array(a, dtype=np.int64)
+    if intt_batch is not None:
+        intt_batch(a.reshape(-1, N), ZETAS_INV_F64, float(N_INV))
+        return a
+
+    lead = a.shape[:-1]
+    length, blocks = 1, N // 2
+    while blocks >= 1:
+        v = a.reshape(*lead, blocks, 2, length)
+        zetas = ZETAS_INV[blocks:2 * blocks, None]
+        lo = v[..., 0, :].copy()
+        v[..., 0, :] = (lo + v[..., 1, :]) % Q
+        v[..., 1, :] = (zetas * (lo - v[..., 1, :])) % Q
+        length *= 2
+        blocks //= 2
+    return (a * N_INV) % Q
+
+
 def test_performance():
     """Test polynomial operations performance"""
     import time
@@ -135,6 +212,15 @@ def test_performance():
     print("p2:", small_p2)
     print("p1 + p2:", small_p1 + small_p2)
     print("p1 * p2:", small_p1 * small_p2)
+    assert np.array_equal((small_p1 * small_p2).coefficients[:3], [3, 10, 8])
+
+    # NTT product must match the schoolbook product, including unreduced
+    # and negative coefficients
+    for low, high in [(0, Polynomial.Q), (-2**31, 2**31), (-2**40, 2**40), (-Polynomial.Q, 0)]:
+        x = Polynomial(np.random.randint(low, high, size, dtype=np.int64))
+        y = Polynomial(np.random.randint(low, high, size, dtype=np.int64))
+        assert np.array_equal((x * y).coefficients, x._mul_convolve(y)), (low, high)
+    print("NTT product matches schoolbook product")
 
 
 if __name__ == "__main__":